@@ -1,9 +1,17 @@
 # notifier.py
-import os, time, math, json, datetime, pytz, requests
-from dateutil import tz
+import os, re, time, math, json, heapq, datetime, requests
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from orjson import loads as json_loads  # быстрый C-парсер JSON
+except Exception:
+    json_loads = json.loads
 
 # ---- Настройки ----
-MSK = pytz.timezone("Europe/Moscow")
+MSK = ZoneInfo("Europe/Moscow")
 BOT_TOKEN = os.getenv("TG_BOT_TOKEN")
 CHAT_ID = os.getenv("TG_CHAT_ID")
 
@@ -12,34 +20,88 @@ WATCHLIST_TOP_N = int(os.getenv("WATCHLIST_TOP_N", 12))
 WATCHLIST_MIN_QUOTE_VOL = float(os.getenv("WATCHLIST_MIN_QUOTE_VOL", 50_000_000))  # по котировочной валюте USDT
 INTRADAY_TOP_BY_VOLUME = int(os.getenv("INTRADAY_TOP_BY_VOLUME", 40))  # скольким топ-парам считать 1ч-движение
 INTRADAY_TOP_N = int(os.getenv("INTRADAY_TOP_N", 5))  # сколько самых сильных/слабых за 1ч
+HTTP_MAX_WORKERS = int(os.getenv("HTTP_MAX_WORKERS", 10))  # сколько HTTP-запросов выполнять параллельно
 
 # ---- Утилиты ----
+# Одна сессия на весь запуск: keep-alive вместо TLS-рукопожатия на каждый запрос,
+# пул рассчитан на параллельные запросы, 5xx повторяем с бэкоффом.
+# Retry-After не слушаем: иначе urllib3 молча повторяет и 429 — Binance за это банит IP
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=32, pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504],
+                      respect_retry_after_header=False),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+# Binance отдаёт /ticker/24hr сжатым в ~6 раз; requests распаковывает прозрачно
+SESSION.headers.update({"Accept-Encoding": "gzip, deflate"})
+
 def get_json(url, params=None, headers=None, timeout=10):
     try:
-        r = requests.get(url, params=params or {}, headers=headers or {}, timeout=timeout)
+        r = SESSION.get(url, params=params, headers=headers, timeout=timeout)
         if r.status_code == 200:
-            return r.json()
+            return json_loads(r.content)
     except Exception:
         pass
     return None
 
+def gather(*calls):
+    # Независимые запросы (fn, *args) — параллельно; результаты в исходном порядке
+    with ThreadPoolExecutor(max_workers=min(HTTP_MAX_WORKERS, len(calls))) as ex:
+        futures = [ex.submit(fn, *args) for fn, *args in calls]
+        return [f.result() for f in futures]
+
+def split_chunks(text, max_len=3500):
+    # Режем по границам строк за один проход по позициям переводов строки;
+    # строку длиннее max_len режем жёстко
+    offsets = [m.end() for m in re.finditer("\n", text)] + [len(text)]
+    chunks = []
+    start = cut = 0
+    for end in offsets:
+        if end - start > max_len:
+            if cut > start:
+                chunks.append(text[start:cut])
+                start = cut
+            while end - start > max_len:
+                chunks.append(text[start:start+max_len])
+                start += max_len
+        cut = end
+    chunks.append(text[start:])
+    return [c.rstrip("\n") for c in chunks if c.strip("\n")]
+
 def tg_send(text):
     if not BOT_TOKEN or not CHAT_ID:
         print("Set TG_BOT_TOKEN and TG_CHAT_ID")
         return
-    # Telegram лимит 4096 символов; режем на чанки
-    chunk = 3500
-    for i in range(0, len(text), chunk):
-        try:
-            requests.get(
-                f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-                params={"chat_id": CHAT_ID, "text": text[i:i+chunk]},
-                timeout=10
-            )
-        except Exception:
-            pass
+    # Telegram лимит 4096 символов; режем на чанки по строкам.
+    # Шлём по порядку, текст — в теле POST, а не в URL
+    for part in split_chunks(text, 4000):
+        for attempt in range(3):
+            try:
+                r = SESSION.post(
+                    f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
+                    data={"chat_id": CHAT_ID, "text": part},
+                    timeout=10
+                )
+            except Exception:
+                break
+            if r.status_code != 429 or attempt == 2:
+                break
+            # Флуд-контроль Telegram: ждём, сколько просят в Retry-After, и повторяем
+            try:
+                time.sleep(int(r.headers.get("Retry-After", 1)))
+            except ValueError:
+                time.sleep(1)
 
 # ---- Источники данных (без ключей) ----
+# Плечевые токены (BTCUPUSDT, ETHBULLUSDT, ...): базы, под которые Binance выпускал
+# такие токены, + маркер прямо перед USDT. Обычные пары вроде JUPUSDT/SYRUPUSDT не трогаем
+_LEVERAGED_BASES = ("BTC", "ETH", "BNB", "XRP", "ADA", "DOT", "LINK", "LTC", "BCH", "EOS",
+                    "TRX", "XTZ", "XLM", "FIL", "SXP", "YFI", "UNI", "AAVE", "SUSHI", "1INCH")
+_LEVERAGED_RE = re.compile(
+    r"(?:%s)(?:UP|DOWN|BULL|BEAR|3L|3S|5L|5S)USDT$" % "|".join(_LEVERAGED_BASES))
+
 def binance_ticker_24h(symbol):
     url = "https://api.binance.com/api/v3/ticker/24hr"
     j = get_json(url, {"symbol": symbol})
@@ -94,66 +156,60 @@ def binance_open_interest_trend(symbol="BTCUSDT"):
     except Exception:
         return None
 
-def binance_watchlist_usdt(top_n=12, min_quote_vol=50_000_000, exclude_leveraged=True):
-    # Топ USDT-пары по ликвидности и 24ч моментуму
+def binance_usdt_tickers_24h():
+    # Снимок /ticker/24hr (~2000 пар) — самый тяжёлый ответ, берём один раз.
+    # Сразу отбрасываем не-USDT и пары без цены, числа парсим один раз:
+    # [(symbol, quote_vol, ch24, leveraged)]
     url = "https://api.binance.com/api/v3/ticker/24hr"
     j = get_json(url)
     if not j: return []
-    out = []
+    rows = []
     for x in j:
         sym = x.get("symbol", "")
         if not sym.endswith("USDT"):
             continue
-        if exclude_leveraged and any(t in sym for t in ("UP","DOWN","BULL","BEAR","3L","3S","5L","5S")):
-            continue
         try:
             quote_vol = float(x.get("quoteVolume", 0))
             ch24 = float(x.get("priceChangePercent", 0))
             last_price = float(x.get("lastPrice", 0))
         except Exception:
             continue
-        if quote_vol >= min_quote_vol and last_price > 0:
-            out.append({"symbol": sym, "quote_vol": quote_vol, "ch24": ch24})
-    out.sort(key=lambda z: (z["quote_vol"], z["ch24"]), reverse=True)
-    return [o["symbol"] for o in out[:top_n]]
+        if last_price > 0:
+            rows.append((sym, quote_vol, ch24, bool(_LEVERAGED_RE.search(sym))))
+    return rows
 
-def binance_intraday_movers(top_by_volume=40, top_n=5):
+def binance_watchlist_usdt(tickers, top_n=12, min_quote_vol=50_000_000, exclude_leveraged=True):
+    # Топ USDT-пары по ликвидности и 24ч моментуму
+    out = [t for t in tickers
+           if t[1] >= min_quote_vol and not (exclude_leveraged and t[3])]
+    return [o[0] for o in heapq.nlargest(top_n, out, key=lambda z: (z[1], z[2]))]
+
+def binance_change_1h(symbol):
+    # 1ч-изменение по 12 свечам 5m: (symbol, %) или None
+    url = "https://api.binance.com/api/v3/klines"
+    k = get_json(url, {"symbol": symbol, "interval": "5m", "limit": 12})
+    if not k or len(k) < 2: return None
+    try:
+        first_open, last_close = float(k[0][1]), float(k[-1][4])
+    except Exception:
+        return None
+    # Нулевое открытие (пара без торгов) — не мувер, а мусорная строка с 0%
+    if first_open <= 0:
+        return None
+    return symbol, (last_close/first_open - 1)*100
+
+def binance_intraday_movers(tickers, top_by_volume=40, top_n=5):
     # Находим топ ликвидные USDT-пары и считаем 1ч-изменение (12 свечей по 5м)
-    url = "https://api.binance.com/api/v3/ticker/24hr"
-    j = get_json(url)
-    if not j: return [], []
-    rows = []
-    for x in j:
-        sym = x.get("symbol","")
-        if not sym.endswith("USDT"): continue
-        if any(t in sym for t in ("UP","DOWN","BULL","BEAR","3L","3S","5L","5S")): continue
-        try:
-            quote_vol = float(x.get("quoteVolume", 0))
-            last_price = float(x.get("lastPrice", 0))
-        except Exception:
-            continue
-        if quote_vol > 0 and last_price > 0:
-            rows.append((sym, quote_vol))
-    rows.sort(key=lambda z: z[1], reverse=True)
-    pool = [r[0] for r in rows[:top_by_volume]]
-
-    movers = []
-    kline_url = "https://api.binance.com/api/v3/klines"
-    for sym in pool:
-        k = get_json(kline_url, {"symbol": sym, "interval": "5m", "limit": 12})
-        if not k or len(k) < 2: continue
-        try:
-            first_open = float(k[0][1])
-            last_close = float(k[-1][4])
-            ch1h = (last_close/first_open - 1)*100 if first_open > 0 else 0.0
-            movers.append((sym, ch1h))
-        except Exception:
-            continue
+    rows = [t for t in tickers if t[1] > 0 and not t[3]]
+    pool = [r[0] for r in heapq.nlargest(top_by_volume, rows, key=lambda z: z[1])]
+
+    # Свечи по парам независимы — запрашиваем параллельно, порядок сохраняет map
+    with ThreadPoolExecutor(max_workers=HTTP_MAX_WORKERS) as ex:
+        movers = [m for m in ex.map(binance_change_1h, pool) if m]
     if not movers:
         return [], []
-    movers.sort(key=lambda z: z[1], reverse=True)
-    top_pos = movers[:top_n]
-    top_neg = sorted(movers[-top_n:], key=lambda z: z[1])  # самые слабые
+    top_pos = heapq.nlargest(top_n, movers, key=lambda z: z[1])
+    top_neg = heapq.nsmallest(top_n, movers, key=lambda z: z[1])  # самые слабые
     return top_pos, top_neg
 
 def yfinance_macro():
@@ -169,13 +225,12 @@ def yfinance_macro():
             h = yf.Ticker(s).history(period="2d", interval="1d")
             if h is None or h.empty:
                 continue
-            closes = h["Close"].tolist()
-            if len(closes) == 1:
-                price = closes[-1]
+            closes = h["Close"].to_numpy()
+            price = float(closes[-1])
+            if closes.size == 1:
                 ch = 0.0
             else:
-                price = closes[-1]
-                prev = closes[-2]
+                prev = float(closes[-2])
                 ch = (price/prev - 1)*100 if prev else 0.0
             out.append(f"{s}: {price:.2f} ({ch:+.2f}%)")
         except Exception:
@@ -183,19 +238,22 @@ def yfinance_macro():
     return out
 
 # ---- Формирование сообщения ----
-def fmt_usd(x):
-    if x >= 1000:
-        return f"{x:,.2f}".replace(",", " ")
-    return f"{x:.2f}"
+# Разделитель тысяч — пробел
+_THOUSANDS_SPACE = str.maketrans(",", " ")
 
-def build_message():
-    now = datetime.datetime.now(MSK).strftime("%Y-%m-%d %H:%M")
-    lines = [f"Крипто-дайджест (дейтрейд) {now} МСК"]
+def fmt_usd(x):
+    # Ниже 1000 формат ",.2f" и так не ставит разделитель
+    return format(x, ",.2f").translate(_THOUSANDS_SPACE)
 
+# Секции дайджеста: каждая сама ходит за данными и возвращает свои строки
+def section_market():
     # Рынок: BTC/ETH (Binance)
-    btc = binance_ticker_24h("BTCUSDT")
-    eth = binance_ticker_24h("ETHUSDT")
-    lines.append("- Рынок:")
+    btc, eth, eb = gather(
+        (binance_ticker_24h, "BTCUSDT"),
+        (binance_ticker_24h, "ETHUSDT"),
+        (binance_price, "ETHBTC"),
+    )
+    lines = ["- Рынок:"]
     if btc:
         lines.append(f"  • BTC: ${fmt_usd(btc['last'])} ({btc['ch24']:+.2f}% за 24ч)")
     else:
@@ -206,67 +264,94 @@ def build_message():
         lines.append("  • ETH: n/a")
 
     # ETH/BTC (ротация)
-    eb = binance_price("ETHBTC")
     if eb is not None:
         lines.append(f"  • ETH/BTC: {eb:.6f}")
+    return lines
 
+def section_levels():
     # PDH/PDL (вчера)
-    for sym, tag in (("BTCUSDT","BTC"), ("ETHUSDT","ETH")):
-        hi, lo = binance_kline_pdhl(sym, "1d")
+    pairs = (("BTCUSDT","BTC"), ("ETHUSDT","ETH"))
+    levels = gather(*[(binance_kline_pdhl, sym, "1d") for sym, _ in pairs])
+    lines = []
+    for (sym, tag), (hi, lo) in zip(pairs, levels):
         if hi is not None:
             lines.append(f"- {tag} уровни (вчера): High {hi:.2f} / Low {lo:.2f}")
         else:
             lines.append(f"- {tag} уровни: n/a")
+    return lines
 
-    # Деривативы
-    f_btc = binance_funding("BTCUSDT")
-    f_eth = binance_funding("ETHUSDT")
+def section_derivatives():
+    f_btc, f_eth, oi_btc, oi_eth = gather(
+        (binance_funding, "BTCUSDT"),
+        (binance_funding, "ETHUSDT"),
+        (binance_open_interest_trend, "BTCUSDT"),
+        (binance_open_interest_trend, "ETHUSDT"),
+    )
     fb = f"{f_btc*100:.4f}%" if f_btc is not None else "n/a"
     fe = f"{f_eth*100:.4f}%" if f_eth is not None else "n/a"
-    lines.append(f"- Фандинг (Binance Perp): BTC {fb} | ETH {fe}")
-
-    oi_btc = binance_open_interest_trend("BTCUSDT")
-    oi_eth = binance_open_interest_trend("ETHUSDT")
+    lines = [f"- Фандинг (Binance Perp): BTC {fb} | ETH {fe}"]
     if oi_btc:
         lines.append(f"  • OI BTC (час): {oi_btc['dir']} {oi_btc['pct']:+.2f}%")
     if oi_eth:
         lines.append(f"  • OI ETH (час): {oi_eth['dir']} {oi_eth['pct']:+.2f}%")
+    return lines
 
+def section_macro():
     # Макро без ключей (опционально)
     macro = yfinance_macro()
     if macro:
-        lines.append("- Макро: " + " | ".join(macro))
-    else:
-        lines.append("- Макро: (yfinance недоступен)")
+        return ["- Макро: " + " | ".join(macro)]
+    return ["- Макро: (yfinance недоступен)"]
 
+def section_watchlist(tickers):
     # Динамический Watchlist (ликвидные USDT-пары)
-    wl = binance_watchlist_usdt(top_n=WATCHLIST_TOP_N, min_quote_vol=WATCHLIST_MIN_QUOTE_VOL)
+    wl = binance_watchlist_usdt(tickers, top_n=WATCHLIST_TOP_N, min_quote_vol=WATCHLIST_MIN_QUOTE_VOL)
     if wl:
-        lines.append("- Watchlist (ликвидные):")
-        lines.append("  " + ", ".join(wl))
-    else:
-        lines.append("- Watchlist: n/a")
+        return ["- Watchlist (ликвидные):", "  " + ", ".join(wl)]
+    return ["- Watchlist: n/a"]
 
+def section_movers(tickers):
     # Интрадей-движки (последний час) — для дейтрейда
-    pos, neg = binance_intraday_movers(top_by_volume=INTRADAY_TOP_BY_VOLUME, top_n=INTRADAY_TOP_N)
-    if pos or neg:
-        if pos:
-            lines.append(f"- 1ч лонг-импульс: " + ", ".join([f"{s} {c:+.2f}%" for s,c in pos]))
-        if neg:
-            lines.append(f"- 1ч шорт-импульс: " + ", ".join([f"{s} {c:+.2f}%" for s,c in neg]))
-    else:
-        lines.append("- 1ч импульсы: n/a")
+    pos, neg = binance_intraday_movers(tickers, top_by_volume=INTRADAY_TOP_BY_VOLUME, top_n=INTRADAY_TOP_N)
+    if not pos and not neg:
+        return ["- 1ч импульсы: n/a"]
+    lines = []
+    if pos:
+        lines.append(f"- 1ч лонг-импульс: " + ", ".join([f"{s} {c:+.2f}%" for s,c in pos]))
+    if neg:
+        lines.append(f"- 1ч шорт-импульс: " + ", ".join([f"{s} {c:+.2f}%" for s,c in neg]))
+    return lines
 
-    # События
-    lines.append("- События: без API-ключей — проверяйте https://coinmarketcal.com вручную")
+# Статичный хвост сообщения: события и тактический чек-лист под дейтрейд
+_FOOTER_LINES = (
+    "- События: без API-ключей — проверяйте https://coinmarketcal.com вручную",
+    "- Тактика:",
+    "  • Следим за реакцией на PDH/PDL; удержание/ретест уровня даёт триггер, ложный пробой — инвалидация.",
+    "  • ETH/BTC ↑ — повышаем фокус на альты; ETH/BTC ↓ — приоритет BTC/мейджоры.",
+    "  • Фандинг и OI: рост OI при падающей цене и высоком позитивном фандинге — риск лонг-сквиза.",
+    "  • Риск-менеджмент: фиксируйте стоп заранее, 1–2% риска на сделку, избегайте усреднений против тренда.",
+)
+
+# Порядок секций в сообщении
+SECTIONS = (section_market, section_levels, section_derivatives,
+            section_macro, section_watchlist, section_movers)
+# Секции, работающие по общему снимку /ticker/24hr (USDT-пары)
+TICKER_SECTIONS = (section_watchlist, section_movers)
+
+def build_message():
+    now = datetime.datetime.now(MSK).strftime("%Y-%m-%d %H:%M")
+    lines = [f"Крипто-дайджест (дейтрейд) {now} МСК"]
 
-    # Тактический чек-лист под дейтрейд
-    lines.append("- Тактика:")
-    lines.append("  • Следим за реакцией на PDH/PDL; удержание/ретест уровня даёт триггер, ложный пробой — инвалидация.")
-    lines.append("  • ETH/BTC ↑ — повышаем фокус на альты; ETH/BTC ↓ — приоритет BTC/мейджоры.")
-    lines.append("  • Фандинг и OI: рост OI при падающей цене и высоком позитивном фандинге — риск лонг-сквиза.")
-    lines.append("  • Риск-менеджмент: фиксируйте стоп заранее, 1–2% риска на сделку, избегайте усреднений против тренда.")
+    # Секции ходят в разные эндпоинты и ждут сеть — собираем параллельно,
+    # выводим в фиксированном порядке
+    with ThreadPoolExecutor(max_workers=len(SECTIONS)) as ex:
+        futures = {s: ex.submit(s) for s in SECTIONS if s not in TICKER_SECTIONS}
+        tickers = binance_usdt_tickers_24h()
+        futures.update({s: ex.submit(s, tickers) for s in TICKER_SECTIONS})
+        for s in SECTIONS:
+            lines.extend(futures[s].result())
 
+    lines.extend(_FOOTER_LINES)
     return "\n".join(lines)
 
 if __name__ == "__main__":